@@ -0,0 +1,161 @@
+import math
+
+import numpy as np
+
+try:
+    from numba import config, njit, prange
+except ImportError:
+    def njit(*args, **kwargs):
+        return lambda func: func
+    prange = range
+else:
+    # kernels run on Streamlit's script threads, where a TBB pool keeps the
+    # interpreter from exiting; OpenMP is thread-safe and shuts down cleanly
+    config.THREADING_LAYER_PRIORITY = ['omp', 'tbb', 'workqueue']
+
+# fastmath without nnan/ninf: night hours carry an infinite shunt resistance;
+# numpy error model drops the ZeroDivisionError checks from the inner loops
+FASTMATH = {'nsz', 'arcp', 'contract', 'afn', 'reassoc'}
+
+NEWTON_TOL = 1e-6
+NEWTON_MAXITER = 100
+
+# calcparams_cec defaults (silicon band gap) and the Boltzmann constant in eV/K, as pvlib uses them
+EG_REF = 1.121
+D_EG_DT = -0.0002677
+K_BOLTZMANN = 8.617333262145179e-05
+
+
+@njit(cache=True, fastmath=FASTMATH, error_model='numpy', nogil=True)
+def _mpp_sandia(iph, i0, rs, rsh, nvth, paco, pdco, vdco, pso, c0, c1, c2, c3, pnt):
+    # Max power point of the single-diode model (bishop88 Newton search on dP/dV
+    # over the diode voltage) followed by the sandia inverter, for one hour.
+    # everything that is fixed for the hour is hoisted out of the Newton loop,
+    # which then costs one exp and two divisions per iteration
+    g_sh = 1.0 / rsh
+    inv_nvth = 1.0 / nvth
+    i0_nvth = i0 * inv_nvth
+    vd = nvth * math.log(iph / i0 + 1.0) if iph > 0.0 else 0.0
+    for _ in range(NEWTON_MAXITER):
+        exp_vd = math.exp(vd * inv_nvth)
+        i = iph - i0 * (exp_vd - 1.0) - vd * g_sh
+        v = vd - i * rs
+        g_diode = i0_nvth * exp_vd
+        grad_i = -g_diode - g_sh
+        grad_v = 1.0 - grad_i * rs
+        inv_grad_v = 1.0 / grad_v
+        grad = grad_i * inv_grad_v
+        grad_p = v * grad + i
+        grad2i = -g_diode * inv_nvth
+        grad2v = -grad2i * rs
+        grad2p = grad_v * grad + v * (grad2i - grad * grad2v) * inv_grad_v + grad_i
+        if grad2p == 0.0:
+            break
+        step = grad_p / grad2p
+        vd -= step
+        if abs(step) < NEWTON_TOL:
+            break
+
+    i = iph - i0 * math.expm1(vd * inv_nvth) - vd * g_sh
+    v = vd - i * rs
+    p = i * v
+    if not (math.isfinite(p) and math.isfinite(v)):
+        i, v, p = 0.0, 0.0, 0.0
+
+    a = pdco * (1.0 + c1 * (v - vdco))
+    b = pso * (1.0 + c2 * (v - vdco))
+    c = c0 * (1.0 + c3 * (v - vdco))
+    p_ac = (paco / (a - b) - c * (a - b)) * (p - b) + c * (p - b) ** 2
+    p_ac = min(paco, p_ac)
+    if p < pso:
+        p_ac = -abs(pnt)
+    return i, v, p, p_ac
+
+
+@njit(cache=True, fastmath=FASTMATH, error_model='numpy', nogil=True)
+def _cec_params(irradiance, temp_cell, alpha_sc, module):
+    # calcparams_cec (De Soto with the Adjust-ed alpha_sc) for one hour:
+    # photocurrent, saturation current, shunt resistance, nNsVth
+    t_ref = 25.0 + 273.15
+    t_cell = temp_cell + 273.15
+    e_g = EG_REF * (1.0 + D_EG_DT * (t_cell - t_ref))
+    iph = irradiance / 1000.0 * (module[2] + alpha_sc * (t_cell - t_ref))
+    i0 = module[3] * (t_cell / t_ref) ** 3 * math.exp(EG_REF / (K_BOLTZMANN * t_ref)
+                                                    - e_g / (K_BOLTZMANN * t_cell))
+    rsh = module[4] * 1000.0 / irradiance if irradiance > 0.0 else math.inf
+    nvth = module[1] * t_cell / t_ref
+    return iph, i0, rsh, nvth
+
+
+@njit(cache=True, fastmath=FASTMATH, error_model='numpy', nogil=True)
+def cec_sandia_ac(effective_irradiance, temp_cell, module, inverter):
+    # CEC diode parameters, max power point and sandia inverter per hour, straight
+    # from the effective irradiance and cell temperature arrays
+    #   module: alpha_sc, a_ref, I_L_ref, I_o_ref, R_sh_ref, R_s, Adjust
+    #   inverter: Paco, Pdco, Vdco, Pso, C0, C1, C2, C3, Pnt
+    n = effective_irradiance.shape[0]
+    i_mp = np.empty(n)
+    v_mp = np.empty(n)
+    p_mp = np.empty(n)
+    ac = np.empty(n)
+    alpha_sc = module[0] * (1.0 - module[6] / 100.0)
+    for k in range(n):
+        iph, i0, rsh, nvth = _cec_params(effective_irradiance[k], temp_cell[k], alpha_sc, module)
+        i_mp[k], v_mp[k], p_mp[k], ac[k] = _mpp_sandia(
+            iph, i0, module[5], rsh, nvth,
+            inverter[0], inverter[1], inverter[2], inverter[3], inverter[4],
+            inverter[5], inverter[6], inverter[7], inverter[8])
+    return i_mp, v_mp, p_mp, ac
+
+
+@njit(cache=True, fastmath=FASTMATH, error_model='numpy', nogil=True, parallel=True)
+def compute_pv_sweep(weather, solpos, tilts, azimuths, module, inverter, temperature_model, albedo):
+    # AC power (W) for each (tilt, azimuth) pair and hour. Geometries run in parallel;
+    # per hour: Hay-Davies POA, SAPM cell temperature, CEC diode parameters, MPP, inverter.
+    #   weather: (hours, 5) ghi, dni, dhi, temp_air, wind_speed
+    #   solpos: (hours, 3) apparent_zenith, azimuth, dni_extra
+    #   module: alpha_sc, a_ref, I_L_ref, I_o_ref, R_sh_ref, R_s, Adjust
+    #   inverter: Paco, Pdco, Vdco, Pso, C0, C1, C2, C3, Pnt
+    #   temperature_model: a, b, deltaT
+    n_hours = weather.shape[0]
+    ac = np.empty((tilts.shape[0], n_hours))
+    alpha_sc = module[0] * (1.0 - module[6] / 100.0)
+    for g in prange(tilts.shape[0]):
+        cos_tilt = math.cos(math.radians(tilts[g]))
+        sin_tilt = math.sin(math.radians(tilts[g]))
+        for h in range(n_hours):
+            ghi = weather[h, 0]
+            dni = weather[h, 1]
+            dhi = weather[h, 2]
+            zenith = math.radians(solpos[h, 0])
+            cos_zenith = math.cos(zenith)
+            projection = cos_tilt * cos_zenith + sin_tilt * math.sin(zenith) * math.cos(
+                math.radians(solpos[h, 1] - azimuths[g]))
+            projection = min(max(projection, -1.0), 1.0)
+
+            poa_direct = max(dni * projection, 0.0)
+            rb = max(projection, 0.0) / max(cos_zenith, 0.01745)
+            anisotropy = dni / solpos[h, 2]
+            poa_sky = (max(dhi * (1.0 - anisotropy) * 0.5 * (1.0 + cos_tilt), 0.0)
+                       + max(dhi * anisotropy * rb, 0.0))
+            poa_ground = ghi * albedo * (1.0 - cos_tilt) * 0.5
+            poa = poa_direct + poa_sky + poa_ground
+
+            temp_cell = (poa * math.exp(temperature_model[0] + temperature_model[1] * weather[h, 4])
+                         + weather[h, 3] + poa / 1000.0 * temperature_model[2])
+            iph, i0, rsh, nvth = _cec_params(poa, temp_cell, alpha_sc, module)
+
+            ac[g, h] = _mpp_sandia(iph, i0, module[5], rsh, nvth,
+                                   inverter[0], inverter[1], inverter[2], inverter[3], inverter[4],
+                                   inverter[5], inverter[6], inverter[7], inverter[8])[3]
+    return ac
+
+
+def warm_up():
+    # compile (or load from the numba cache) before the first forecast
+    ones = np.ones(2)
+    module = np.array([0.0, 2.0, 5.0, 1e-10, 300.0, 0.3, 0.0])
+    inverter = np.array([250.0, 260.0, 40.0, 2.0, 0.0, 0.0, 0.0, 0.0, 0.1])
+    cec_sandia_ac(ones * 800.0, ones * 25.0, module, inverter)
+    compute_pv_sweep(np.ones((2, 5)), np.ones((2, 3)) * 1000.0, ones, ones,
+                     module, inverter, np.array([-3.47, -0.0594, 3.0]), 0.25)
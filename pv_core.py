@@ -0,0 +1,435 @@
+import datetime
+import functools
+import hashlib
+import importlib.resources
+import logging
+import os
+import threading
+import time
+import zoneinfo
+from concurrent.futures import ThreadPoolExecutor
+from pathlib import Path
+
+import streamlit as st
+import numpy as np
+import pandas as pd
+import pvlib
+import niquests
+import openmeteo_requests
+from streamlit.runtime.scriptrunner import add_script_run_ctx, get_script_run_ctx
+from pvlib.location import Location
+from pvlib.modelchain import ModelChain
+
+import _kernels
+
+logger = logging.getLogger(__name__)
+
+try:
+    import numba  # noqa: F401
+    SOLAR_POSITION_METHOD = 'nrel_numba'
+except ImportError:
+    SOLAR_POSITION_METHOD = 'nrel_numpy'
+
+# Open-Meteo hourly variables in request order, mapped to the weather column names
+HOURLY_VARIABLES = {
+    'shortwave_radiation': 'ghi',
+    'direct_normal_irradiance': 'dni',
+    'diffuse_radiation': 'dhi',
+    'temperature_2m': 'temperature_2m',
+    'wind_speed_10m': 'wind_speed_10m',
+}
+
+@st.cache_resource(show_spinner=False)
+def get_openmeteo_client():
+    # one pooled keep-alive session per process, so reruns skip the TCP/TLS handshake;
+    # niquests negotiates HTTP/2 and compressed responses with the API on its own
+    session = niquests.Session(pool_connections=4, pool_maxsize=4)
+    return openmeteo_requests.Client(session=session)
+
+CACHE_DIR = Path.home() / '.cache' / 'pv_forecast'
+# Open-Meteo refreshes its models hourly; within this many seconds a forecast is reused as is
+FORECAST_TTL = 900
+# ~1 km, finer than the forecast models' grid cells, so coordinates that differ only in
+# the last typed digits share one request and one cached forecast
+COORD_DECIMALS = 2
+
+def _write_parquet(frame, path):
+    # write under a private name and rename, so a concurrent reader never sees half a file
+    # pid and thread: the prefetch pool and the script thread can write the same file at once
+    tmp_path = path.with_name(f"{path.name}.{os.getpid()}.{threading.get_ident()}.tmp")
+    try:
+        path.parent.mkdir(parents=True, exist_ok=True)
+        frame.to_parquet(tmp_path)
+        os.replace(tmp_path, path)
+    except OSError:
+        tmp_path.unlink(missing_ok=True)
+
+# --- Helper Functions ---
+def _grid_coord(lat, lon):
+    return round(lat, COORD_DECIMALS), round(lon, COORD_DECIMALS)
+
+@functools.lru_cache(maxsize=4)
+def _tomorrow(today, tz):
+    # local midnight starting the forecast day; built once per day and zone
+    return pd.Timestamp(today, tz=tz) + pd.DateOffset(days=1)
+
+def _forecast_key(lats, lons, tz):
+    # one request for all locations; sorted so the cache key ignores input order
+    coords = tuple(sorted({_grid_coord(lat, lon) for lat, lon in zip(lats, lons)}))
+    tomorrow = _tomorrow(datetime.datetime.now(zoneinfo.ZoneInfo(tz)).date(), tz)
+    return coords, tz, tomorrow
+
+def fetch_forecast(lats, lons, tz):
+    coords, tz, tomorrow = _forecast_key(lats, lons, tz)
+    try:
+        forecasts = _fetch_forecast(coords, tz, tomorrow)
+    except openmeteo_requests.OpenMeteoRequestsError as e:
+        st.error(f"Failed to fetch weather data: {e}")
+        return {(lat, lon): pd.DataFrame() for lat, lon in zip(lats, lons)}
+    for _, error in forecasts.values():
+        if error:
+            st.error(error)
+    # keyed by the caller's own coordinates
+    return {(lat, lon): forecasts[_grid_coord(lat, lon)][0] for lat, lon in zip(lats, lons)}
+
+@st.cache_resource(show_spinner=False)
+def _prefetch_executor():
+    return ThreadPoolExecutor(max_workers=2, thread_name_prefix='forecast-prefetch')
+
+def _in_background(func, *args):
+    # run on the prefetch pool under this session's script context, so the cached
+    # functions it calls behave as they do on the script thread. The pool is shared by
+    # all sessions, so only submit when this session's inputs changed since the last time
+    last_key = f"_prefetched_{func.__name__}"
+    if st.session_state.get(last_key) == args:
+        return
+    st.session_state[last_key] = args
+    ctx = get_script_run_ctx()
+
+    def run():
+        add_script_run_ctx(threading.current_thread(), ctx)
+        try:
+            func(*args)
+        except openmeteo_requests.OpenMeteoRequestsError:
+            pass  # failures aren't cached; the Run click retries and reports them
+        except Exception:
+            logger.exception("Background %s failed", func.__name__)
+
+    _prefetch_executor().submit(run)
+
+def prefetch_forecast(lats, lons, tz):
+    # start the request in the background so it overlaps with the user filling in
+    # the rest of the form; Run Forecast then hits the warm cache
+    _in_background(_fetch_forecast, *_forecast_key(lats, lons, tz))
+
+def prefetch_pv_output(lat, lon, tz, tilt, azimuth, module_key, inverter_key):
+    # same for the model run once the system is picked; plant size is applied after the
+    # cache, so Run Forecast is left with the scaling
+    _in_background(_warm_pv_output, _forecast_key([lat], [lon], tz), lat, lon, tilt, azimuth, module_key, inverter_key)
+
+def _warm_pv_output(forecast_key, lat, lon, tilt, azimuth, module_key, inverter_key):
+    coords, tz, tomorrow = forecast_key
+    weather, error = _fetch_forecast(coords, tz, tomorrow)[coords[0]]
+    if not error:
+        _run_chain(weather_fingerprint(weather), weather, lat, lon, tilt, azimuth, module_key, inverter_key)
+
+def _forecast_cache_path(coord, tz, tomorrow):
+    key = repr((coord, tz, tomorrow.isoformat())).encode()
+    return CACHE_DIR / 'forecasts' / f"{hashlib.blake2b(key, digest_size=16).hexdigest()}.parquet"
+
+def _read_cached_forecast(coord, tz, tomorrow):
+    path = _forecast_cache_path(coord, tz, tomorrow)
+    try:
+        if time.time() - path.stat().st_mtime < FORECAST_TTL:
+            return pd.read_parquet(path)
+        path.unlink()
+    except (OSError, ValueError):
+        pass
+    return None
+
+def _prune_forecast_cache():
+    # drop expired forecasts (and temp files left by interrupted writes) for all locations,
+    # so a long-running server doesn't collect one file per location and day forever
+    now = time.time()
+    for path in (CACHE_DIR / 'forecasts').glob('*'):
+        try:
+            if now - path.stat().st_mtime >= FORECAST_TTL:
+                path.unlink()
+        except OSError:
+            pass
+
+# shared by reference: callers only read the frames, so skip cache_data's pickle round trip
+@st.cache_resource(show_spinner=False, ttl=FORECAST_TTL)
+def _fetch_forecast(coords, tz, tomorrow):
+    # the on-disk copies outlive the process (and its in-memory cache); request only what's missing
+    forecasts = {}
+    for coord in coords:
+        cached = _read_cached_forecast(coord, tz, tomorrow)
+        if cached is not None:
+            forecasts[coord] = cached, None
+    missing = tuple(coord for coord in coords if coord not in forecasts)
+    if missing:
+        forecasts.update(_request_forecast(missing, tz, tomorrow))
+    return forecasts
+
+def _request_forecast(coords, tz, tomorrow):
+    url = "https://api.open-meteo.com/v1/forecast"
+    # only tomorrow's local hours (23 or 25 on DST days), given in UTC like the rest of the request
+    first_hour = tomorrow.tz_convert('UTC')
+    last_hour = (tomorrow + pd.DateOffset(days=1) - pd.Timedelta(hours=1)).tz_convert('UTC')
+    params = {
+        'latitude': ",".join(str(lat) for lat, _ in coords),
+        'longitude': ",".join(str(lon) for _, lon in coords),
+        'hourly': ",".join(HOURLY_VARIABLES),
+        'timezone': 'UTC',
+        'start_hour': first_hour.strftime('%Y-%m-%dT%H:%M'),
+        'end_hour': last_hour.strftime('%Y-%m-%dT%H:%M'),
+    }
+    # the client asks for format=flatbuffers, so values arrive as typed arrays;
+    # request errors propagate so they are never cached
+    responses = get_openmeteo_client().weather_api(url, params=params, timeout=10)
+    forecasts = {coord: _hourly_frame(response.Hourly(), tz, tomorrow) for coord, response in zip(coords, responses)}
+    for coord, (df, error) in forecasts.items():
+        if not error:
+            _write_parquet(df, _forecast_cache_path(coord, tz, tomorrow))
+    _prune_forecast_cache()
+    return forecasts
+
+def _hourly_frame(hourly, tz, tomorrow):
+    # (frame, error message) so the caller reports problems outside the cache
+    if hourly is None or hourly.VariablesLength() != len(HOURLY_VARIABLES):
+        return pd.DataFrame(), "No hourly data returned by weather API."
+    # one (hours, variables) block instead of a column-by-column dict
+    values = np.stack([hourly.Variables(i).ValuesAsNumpy() for i in range(len(HOURLY_VARIABLES))], axis=1)
+    if not len(values):
+        return pd.DataFrame(), f"No data available for {tomorrow:%Y-%m-%d} in timezone {tz}."
+    # fixed hourly cadence: the index is the first timestamp plus a step per row
+    times = pd.date_range(
+        start=pd.Timestamp(hourly.Time(), unit='s', tz='UTC'),
+        periods=len(values),
+        freq=pd.Timedelta(seconds=hourly.Interval()),
+        name='time',
+    ).tz_convert(tz)
+    # the stacked block is ours alone, so the frame can wrap it instead of copying
+    return pd.DataFrame(values, index=times, columns=list(HOURLY_VARIABLES.values()), copy=False), None
+
+# --- Load PVLib Tables ---
+# SAM databases shipped inside pvlib's data directory
+SAM_FILES = {
+    'CECmod': 'sam-library-cec-modules-2019-03-05.csv',
+    'CECinverter': 'sam-library-cec-inverters-2019-03-05.csv',
+}
+
+def _read_sam_csv(name):
+    # same parsing as pvlib's retrieve_sam, but left one product per row
+    resource = importlib.resources.files('pvlib') / 'data' / SAM_FILES[name]
+    with importlib.resources.as_file(resource) as csv_path:
+        rows = pd.read_csv(csv_path, index_col=0, skiprows=[1, 2], engine='c', memory_map=True, low_memory=False)
+    rows.columns = rows.columns.str.replace(' ', '_')
+    rows.index = rows.index.str.translate(str.maketrans(' -.()[]:+/",', '____________'))
+    return rows
+
+def _load_sam_table(name):
+    # parquet copy of the SAM CSV, stored product-per-row so every column has one dtype
+    path = CACHE_DIR / f"{name.lower()}-{pvlib.__version__}.parquet"
+    try:
+        return pd.read_parquet(path).T
+    except (OSError, ValueError):
+        pass  # missing, truncated or unreadable: rebuild it from the CSV
+    rows = _read_sam_csv(name)
+    _write_parquet(rows, path)
+    return rows.T
+
+@st.cache_resource(show_spinner=False)
+def get_pv_tables():
+    modules = _load_sam_table('CECmod')
+    inverters = _load_sam_table('CECinverter')
+    # warm the solar position and PV kernel JITs so the first forecast doesn't pay for compilation
+    warmup_times = pd.DatetimeIndex(['2000-06-21 12:00', '2000-06-21 13:00'], tz='UTC')
+    pvlib.solarposition.get_solarposition(warmup_times, 0.0, 0.0, method=SOLAR_POSITION_METHOD, numthreads=1)
+    _kernels.warm_up()
+    return modules, inverters
+
+_modules, _inverters = get_pv_tables()
+
+def _brand_index(keys):
+    # SAM keys are '<Brand>_<Model>...'; group them by brand, brands in sorted order
+    index = {}
+    for key in keys:
+        index.setdefault(key.split('_', 1)[0], []).append(key)
+    return dict(sorted(index.items()))
+
+@st.cache_resource(show_spinner=False)
+def get_brand_index():
+    return _brand_index(_modules.keys()), _brand_index(_inverters.keys())
+
+# the fields the selector labels show, as product-per-row columns selected once for all brands;
+# module keys are '<name>___<year>_', inverter labels lead with the brand part of the key
+_module_ratings = _modules.reindex(['STC', 'Impo', 'Vmpo']).T.astype(float)
+_module_key_parts = _module_ratings.index.str.split('___')
+_module_ratings['name'] = _module_key_parts.str[0]
+_module_ratings['year'] = _module_key_parts.str[1].str.strip('_').fillna('N/A')
+_inverter_ratings = _inverters.reindex(['Paco', 'Pac0', 'Vac']).T
+_inverter_ratings['name'] = _inverter_ratings.index.str.split('_').str[0]
+
+# read on every rerun and never mutated, so shared rather than unpickled per access
+@st.cache_resource(show_spinner=False)
+def get_module_labels(brand):
+    # selectbox labels for one brand, read as one row slice
+    keys = get_brand_index()[0][brand]
+    ratings = _module_ratings.loc[keys]
+    p_stc = ratings['STC'].fillna(ratings['Impo'] * ratings['Vmpo']).fillna(0).astype(int)
+    labels = [f"{name} ({year}, {watts} W)" for name, year, watts in zip(ratings['name'], ratings['year'], p_stc)]
+    return labels, dict(zip(labels, keys))
+
+@st.cache_resource(show_spinner=False)
+def get_inverter_labels(brand):
+    keys = get_brand_index()[1][brand]
+    ratings = _inverter_ratings.loc[keys]
+    paco = ratings['Paco'].fillna(ratings['Pac0']).fillna(0).astype(float) / 1000
+    vac = ratings['Vac'].fillna('N/A')
+    labels = [f"{name} ({p:.2f} kW, {v} V)" for name, p, v in zip(ratings['name'], paco, vac)]
+    return labels, dict(zip(labels, keys))
+
+# parameters read by calcparams_cec and the sandia inverter model
+CEC_MODULE_PARAMETERS = ('alpha_sc', 'a_ref', 'I_L_ref', 'I_o_ref', 'R_sh_ref', 'R_s', 'Adjust')
+SANDIA_INVERTER_PARAMETERS = ('Paco', 'Pdco', 'Vdco', 'Pso', 'C0', 'C1', 'C2', 'C3', 'Pnt')
+# SAPM cell temperature for an open-rack glass/glass mount
+SAPM_TEMPERATURE_PARAMETERS = pvlib.temperature.TEMPERATURE_MODEL_PARAMETERS['sapm']['open_rack_glass_glass']
+# ground reflectance seen by the modules, shared by the model chain and the tilt sweep
+ALBEDO = 0.25
+
+@functools.lru_cache(maxsize=64)
+def _module_params(module_key):
+    params = _modules[module_key]
+    return {k: float(params[k]) for k in CEC_MODULE_PARAMETERS}
+
+@functools.lru_cache(maxsize=64)
+def _inverter_params(inverter_key):
+    params = _inverters[inverter_key]
+    return {k: float(params[k]) for k in SANDIA_INVERTER_PARAMETERS}
+
+def solar_position(times, lat, lon, temp_air):
+    # nrel_numba only takes a scalar temperature; refraction is fine with the daily mean
+    return pvlib.solarposition.get_solarposition(
+        times, lat, lon, temperature=float(np.mean(temp_air)),
+        method=SOLAR_POSITION_METHOD, numthreads=1)
+
+def cec_sandia_dc(mc):
+    # CEC diode parameters, single-diode max power point (bishop88 Newton search) and
+    # sandia inverter evaluated together in one compiled loop over the hours
+    effective_irradiance = mc.results.effective_irradiance
+    module = mc.system.arrays[0].module_parameters
+    inverter = mc.system.inverter_parameters
+    i_mp, v_mp, p_mp, ac = _kernels.cec_sandia_ac(
+        np.ascontiguousarray(effective_irradiance, dtype=np.float64),
+        np.ascontiguousarray(mc.results.cell_temperature, dtype=np.float64),
+        np.array([module[k] for k in CEC_MODULE_PARAMETERS]),
+        np.array([inverter[k] for k in SANDIA_INVERTER_PARAMETERS]),
+    )
+    dc = pd.DataFrame({'i_mp': i_mp, 'v_mp': v_mp, 'p_mp': p_mp}, index=effective_irradiance.index)
+    mc.results.dc = mc.system.scale_voltage_current_power(dc)
+    mc.results.ac = pd.Series(ac, index=effective_irradiance.index, name='ac_power')
+    return mc
+
+def precomputed_ac(mc):
+    # AC power was already filled in by cec_sandia_dc
+    return mc
+
+def weather_fingerprint(weather):
+    digest = hashlib.blake2b(digest_size=16)
+    digest.update(",".join(weather.columns).encode())
+    # fixed unit: frames read back from the disk cache come with a different resolution
+    digest.update(weather.index.as_unit('ns').asi8.tobytes())
+    digest.update(np.ascontiguousarray(weather.to_numpy()).tobytes())
+    return digest.digest()
+
+def compute_pv_output(weather, lat, lon, tilt, azimuth, module_key, inverter_key, num_panels, num_inverters):
+    if weather.empty:
+        return pd.Series(dtype=float), pd.Series(dtype=float), pd.Series(dtype=float)
+    # key the cache on a digest of the raw buffers rather than letting streamlit hash the frame
+    ac_series = _run_chain(weather_fingerprint(weather), weather, lat, lon, tilt, azimuth, module_key, inverter_key)
+    # plant power total in W then convert to kW; plant size stays outside the caches.
+    # one multiply by the folded factor on the raw values, wrapped into a Series once
+    ac_kw = ac_series.to_numpy() * (num_panels * num_inverters / 1000)
+    ac_total_kw = pd.Series(ac_kw, index=ac_series.index, name=ac_series.name)
+    hourly_kwh = ac_total_kw
+    # the forecast covers one local day, so the daily total is a plain sum;
+    # the sorted index means comparing the end points is enough to confirm that
+    days = hourly_kwh.index[[0, -1]].normalize()
+    if days[0] == days[-1]:
+        daily_kwh = pd.Series([ac_kw.sum()], index=days[:1], name=hourly_kwh.name)
+    else:
+        daily_kwh = hourly_kwh.groupby(pd.Grouper(freq='D')).sum()
+    return ac_total_kw, hourly_kwh, daily_kwh
+
+# bounded: keyed on exact site/geometry floats, and every pick in the selectors adds one
+@st.cache_resource(show_spinner=False, max_entries=64)
+def _build_chain(lat, lon, tz, tilt, azimuth, module_key, inverter_key):
+    location = Location(lat, lon, tz)
+    system = pvlib.pvsystem.PVSystem(
+        surface_tilt=tilt,
+        surface_azimuth=azimuth,
+        module_parameters=_module_params(module_key),
+        inverter_parameters=_inverter_params(inverter_key),
+        albedo=ALBEDO,
+        temperature_model_parameters=SAPM_TEMPERATURE_PARAMETERS
+    )
+    mc = ModelChain(system, location, dc_model=cec_sandia_dc, ac_model=precomputed_ac,
+                    aoi_model='no_loss', spectral_model='no_loss')
+    # the chain keeps its results on itself, so sessions sharing it take turns
+    return mc, threading.Lock()
+
+@st.cache_data(show_spinner=False, max_entries=256)
+def _run_chain(weather_hash, _weather, lat, lon, tilt, azimuth, module_key, inverter_key):
+    mc, lock = _build_chain(lat, lon, str(_weather.index.tz), tilt, azimuth, module_key, inverter_key)
+    # float32 through the weather pipeline (a no-op for fetched forecasts, which arrive that way);
+    # the diode solve widens to float64 in cec_sandia_dc
+    mc_weather = _weather.rename(columns={'temperature_2m': 'temp_air', 'wind_speed_10m': 'wind_speed'})
+    mc_weather = mc_weather.astype(np.float32, copy=False)
+    times = mc_weather.index
+    # plain contiguous arrays keep pvlib off its Series alignment paths
+    ghi, dni, dhi = (np.ascontiguousarray(mc_weather[c].to_numpy()) for c in ('ghi', 'dni', 'dhi'))
+    solpos = solar_position(times, lat, lon, mc_weather['temp_air'])
+    # Hay-Davies transposition is plenty for forecast-grade irradiance; Perez isn't worth its cost
+    poa = mc.system.get_irradiance(solpos['apparent_zenith'].to_numpy(), solpos['azimuth'].to_numpy(),
+                                   dni, ghi, dhi,
+                                   dni_extra=pvlib.irradiance.get_extra_radiation(times).to_numpy(),
+                                   model='haydavies')
+    # without AOI or spectral losses the effective irradiance is the plane-of-array total,
+    # so ModelChain can start at cell temperature instead of redoing the weather pipeline
+    mc_weather = mc_weather.assign(poa_global=poa['poa_global'], poa_direct=poa['poa_direct'],
+                                   poa_diffuse=poa['poa_diffuse'], effective_irradiance=poa['poa_global'])
+    with lock:
+        mc.run_model_from_effective_irradiance(mc_weather)
+        try:
+            return mc.results.ac
+        except Exception:
+            return mc.ac
+
+@st.cache_data(show_spinner=False)
+def _sweep_solar_position(weather_hash, _weather, lat, lon):
+    solpos = solar_position(_weather.index, lat, lon, _weather['temperature_2m'])
+    dni_extra = pvlib.irradiance.get_extra_radiation(_weather.index)
+    return np.column_stack([solpos['apparent_zenith'], solpos['azimuth'], dni_extra]).astype(np.float64)
+
+def compute_pv_sweep(weather, lat, lon, tilts, azimuth, module_key, inverter_key, num_panels, num_inverters):
+    # daily plant energy (kWh) per tilt; solar position depends only on time and place,
+    # so it is computed once and every tilt runs through the parallel kernel
+    if weather.empty:
+        return pd.Series(dtype=float)
+    solpos = _sweep_solar_position(weather_fingerprint(weather), weather, lat, lon)
+    weather_arr = np.ascontiguousarray(
+        weather[['ghi', 'dni', 'dhi', 'temperature_2m', 'wind_speed_10m']].to_numpy(np.float64))
+    tilts = np.asarray(tilts, dtype=np.float64)
+    module = _module_params(module_key)
+    inverter = _inverter_params(inverter_key)
+    ac = _kernels.compute_pv_sweep(
+        weather_arr, solpos, tilts, np.full_like(tilts, azimuth),
+        np.array([module[k] for k in CEC_MODULE_PARAMETERS]),
+        np.array([inverter[k] for k in SANDIA_INVERTER_PARAMETERS]),
+        np.array([SAPM_TEMPERATURE_PARAMETERS[k] for k in ('a', 'b', 'deltaT')], dtype=np.float64),
+        ALBEDO,
+    )
+    daily_kwh = ac.sum(axis=1) * num_panels * num_inverters / 1000
+    return pd.Series(daily_kwh, index=pd.Index(tilts, name='Tilt (°)'), name='Daily Energy (kWh)')
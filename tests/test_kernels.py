@@ -0,0 +1,83 @@
+import numpy as np
+import pvlib
+import pytest
+from pvlib.singlediode import bishop88_mpp
+
+import _kernels
+
+MODULE_PARAMETERS = ('alpha_sc', 'a_ref', 'I_L_ref', 'I_o_ref', 'R_sh_ref', 'R_s', 'Adjust')
+INVERTER_PARAMETERS = ('Paco', 'Pdco', 'Vdco', 'Pso', 'C0', 'C1', 'C2', 'C3', 'Pnt')
+SAPM = pvlib.temperature.TEMPERATURE_MODEL_PARAMETERS['sapm']['open_rack_glass_glass']
+ALBEDO = 0.25
+
+MODULES = ['Canadian_Solar_Inc__CS6K_275M', 'SunPower_SPR_X21_345', 'First_Solar__Inc__FS_367']
+INVERTERS = ['SMA_America__SB7700TL_US_22__240V_', 'Enphase_Energy_Inc___C250_72_2LN_S2']
+
+# night, barely lit and bright hours
+IRRADIANCE = np.array([0.0, 1e-3, 0.5, 5.0, 200.0, 800.0, 1200.0])
+TEMP_CELL = np.array([-10.0, 0.0, 5.0, 15.0, 25.0, 45.0, 65.0])
+
+
+@pytest.fixture(scope='module')
+def sam():
+    return pvlib.pvsystem.retrieve_sam('CECmod'), pvlib.pvsystem.retrieve_sam('CECinverter')
+
+
+def _pvlib_ac(module, inverter, effective_irradiance, temp_cell):
+    params = pvlib.pvsystem.calcparams_cec(effective_irradiance, temp_cell,
+                                           *(module[k] for k in MODULE_PARAMETERS))
+    _, v_mp, p_mp = bishop88_mpp(*params, method='newton')
+    v_mp, p_mp = np.nan_to_num(v_mp), np.nan_to_num(p_mp)
+    return p_mp, pvlib.inverter.sandia(v_mp, p_mp, inverter)
+
+
+@pytest.mark.parametrize('module_key', MODULES)
+@pytest.mark.parametrize('inverter_key', INVERTERS)
+def test_cec_sandia_ac_matches_pvlib(sam, module_key, inverter_key):
+    module, inverter = sam[0][module_key], sam[1][inverter_key]
+    _, _, p_mp, ac = _kernels.cec_sandia_ac(
+        IRRADIANCE, TEMP_CELL,
+        np.array([module[k] for k in MODULE_PARAMETERS], dtype=float),
+        np.array([inverter[k] for k in INVERTER_PARAMETERS], dtype=float))
+    expected_p_mp, expected_ac = _pvlib_ac(module, inverter, IRRADIANCE, TEMP_CELL)
+    np.testing.assert_allclose(p_mp, expected_p_mp, rtol=1e-9, atol=1e-9)
+    np.testing.assert_allclose(ac, expected_ac, rtol=1e-9, atol=1e-9)
+
+
+@pytest.mark.parametrize('module_key', MODULES)
+def test_compute_pv_sweep_matches_pvlib(sam, module_key):
+    module, inverter = sam[0][module_key], sam[1][INVERTERS[0]]
+    # ghi, dni, dhi, temp_air, wind_speed per hour, including a dark and a near-dark hour
+    weather = np.array([
+        [0.0, 0.0, 0.0, 5.0, 1.0],
+        [0.5, 0.0, 0.5, 6.0, 1.5],
+        [150.0, 300.0, 60.0, 12.0, 2.0],
+        [600.0, 750.0, 110.0, 24.0, 3.0],
+        [950.0, 880.0, 120.0, 31.0, 0.5],
+    ])
+    # apparent_zenith, azimuth, dni_extra
+    solpos = np.array([
+        [95.0, 60.0, 1360.0],
+        [89.5, 75.0, 1360.0],
+        [70.0, 110.0, 1360.0],
+        [45.0, 150.0, 1360.0],
+        [25.0, 190.0, 1360.0],
+    ])
+    tilts = np.array([0.0, 30.0, 90.0])
+    azimuths = np.array([180.0, 135.0, 240.0])
+    ac = _kernels.compute_pv_sweep(
+        weather, solpos, tilts, azimuths,
+        np.array([module[k] for k in MODULE_PARAMETERS], dtype=float),
+        np.array([inverter[k] for k in INVERTER_PARAMETERS], dtype=float),
+        np.array([SAPM[k] for k in ('a', 'b', 'deltaT')], dtype=float),
+        ALBEDO)
+
+    ghi, dni, dhi, temp_air, wind_speed = weather.T
+    zenith, azimuth, dni_extra = solpos.T
+    for g, (tilt, surface_azimuth) in enumerate(zip(tilts, azimuths)):
+        poa = pvlib.irradiance.get_total_irradiance(
+            tilt, surface_azimuth, zenith, azimuth, dni, ghi, dhi,
+            dni_extra=dni_extra, albedo=ALBEDO, model='haydavies')['poa_global']
+        temp_cell = pvlib.temperature.sapm_cell(poa, temp_air, wind_speed, **SAPM)
+        _, expected_ac = _pvlib_ac(module, inverter, poa, temp_cell)
+        np.testing.assert_allclose(ac[g], expected_ac, rtol=1e-9, atol=1e-9)